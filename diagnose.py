@@ -11,150 +11,225 @@ Date: July 2025
 
 import sys
 import os
+import asyncio
+import json
 import subprocess
 import platform
-from pathlib import Path
+import functools
+import importlib.util
+from collections import defaultdict
+from shutil import which
 
-def print_header(title):
-    """Print a formatted header."""
-    print(f"\n{'='*60}")
-    print(f" {title}")
-    print(f"{'='*60}")
+# platform.architecture() runs `file` on some systems, so look these up once
+_PLAT = platform.platform()
+_ARCH = platform.architecture()
+_SYSREL = f"{platform.system()} {platform.release()}"
 
-def check_python():
+_BAR = '=' * 60
+
+@functools.lru_cache(maxsize=None)
+def resolve(tool: str):
+    """Return the full path to *tool* on PATH, or None if it is not installed."""
+    return which(tool)
+
+async def run_tool(tool, *args, timeout=10):
+    """
+    Run *tool* with *args* and return the CompletedProcess.
+    
+    The tool is resolved to its full path first (the .cmd shim for npm and
+    mmdc on Windows) so no shell is needed. Returns None if the tool is not
+    installed or could not be run.
+    """
+    path = resolve(tool)
+    if path is None:
+        return None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            path, *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    except OSError:
+        return None
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return None
+    return subprocess.CompletedProcess(
+        [path, *args], proc.returncode,
+        stdout.decode('utf-8', errors='ignore'), stderr.decode('utf-8', errors='ignore'))
+
+def format_header(title):
+    """Return a formatted header."""
+    return f"\n{_BAR}\n {title}\n{_BAR}"
+
+async def check_python():
     """Check Python version and installation."""
-    print_header("Python Environment")
-    print(f"Python Version: {sys.version}")
-    print(f"Python Executable: {sys.executable}")
-    print(f"Platform: {platform.platform()}")
-    print(f"Architecture: {platform.architecture()}")
+    lines = [
+        f"Python Version: {sys.version}",
+        f"Python Executable: {sys.executable}",
+        f"Platform: {_PLAT}",
+        f"Architecture: {_ARCH}",
+    ]
+    return "Python Environment", lines
 
-def check_modules():
+async def check_modules():
     """Check required Python modules."""
-    print_header("Python Modules")
+    lines = []
     
-    required_modules = [
-        'flask', 'flask_cors', 'pathlib', 'json', 
-        'base64', 'tempfile', 'subprocess'
-    ]
+    # Only third-party packages need checking; the stdlib is always present
+    required_modules = ['flask', 'flask_cors']
     
     for module in required_modules:
-        try:
-            __import__(module)
-            print(f"✅ {module} - Available")
-        except ImportError as e:
-            print(f"❌ {module} - Not Available ({str(e)})")
+        # find_spec locates the module without executing its import-time code
+        if importlib.util.find_spec(module) is not None:
+            lines.append(f"✅ {module} - Available")
+        else:
+            lines.append(f"❌ {module} - Not Available")
+    
+    return "Python Modules", lines
 
-def check_node():
+async def check_node():
     """Check Node.js and npm installation."""
-    print_header("Node.js Environment")
+    lines = []
+    
+    node_result, npm_result = await asyncio.gather(
+        run_tool('node', '--version'), run_tool('npm', '--version'))
     
     # Check Node.js
-    try:
-        result = subprocess.run(['node', '--version'], 
-                              capture_output=True, text=True, timeout=10, shell=True)
-        if result.returncode == 0:
-            print(f"✅ Node.js: {result.stdout.strip()}")
-        else:
-            print("❌ Node.js: Not available")
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        print("❌ Node.js: Not found")
+    result = node_result
+    if result is None:
+        lines.append("❌ Node.js: Not found")
+    elif result.returncode == 0:
+        lines.append(f"✅ Node.js: {result.stdout.strip()}")
+    else:
+        lines.append("❌ Node.js: Not available")
     
     # Check npm - try multiple methods for Windows
     npm_found = False
-    try:
-        # Method 1: Direct npm command
-        result = subprocess.run(['npm', '--version'], 
-                              capture_output=True, text=True, timeout=10, shell=True)
-        if result.returncode == 0:
-            print(f"✅ npm: {result.stdout.strip()}")
-            npm_found = True
-    except (subprocess.TimeoutExpired, FileNotFoundError):
-        pass
+    # Method 1: Direct npm command
+    result = npm_result
+    if result is not None and result.returncode == 0:
+        lines.append(f"✅ npm: {result.stdout.strip()}")
+        npm_found = True
     
     if not npm_found:
-        try:
-            # Method 2: PowerShell command
-            result = subprocess.run(['powershell', '-Command', 'npm --version'], 
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                print(f"✅ npm: {result.stdout.strip()}")
-                npm_found = True
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
+        # Method 2: PowerShell command
+        result = await run_tool('powershell', '-Command', 'npm --version')
+        if result is not None and result.returncode == 0:
+            lines.append(f"✅ npm: {result.stdout.strip()}")
+            npm_found = True
     
     if not npm_found:
-        print("❌ npm: Not found or not accessible")
-
-def check_mermaid():
-    """Check Mermaid CLI installation."""
-    print_header("Mermaid CLI")
-    
-    found = False
+        lines.append("❌ npm: Not found or not accessible")
     
-    # Method 1: Check via npm list global packages
-    try:
-        result = subprocess.run(['npm', 'list', '-g', '--depth=0'], 
-                              capture_output=True, text=True, timeout=15, 
-                              shell=True, encoding='utf-8', errors='ignore')
-        if result.returncode == 0 and result.stdout and '@mermaid-js/mermaid-cli' in result.stdout:
-            print("✅ @mermaid-js/mermaid-cli: Found in global packages")
-            found = True
-            # Extract version
-            for line in result.stdout.split('\n'):
-                if '@mermaid-js/mermaid-cli' in line:
-                    print(f"   {line.strip()}")
-                    break
-    except (subprocess.TimeoutExpired, FileNotFoundError, UnicodeDecodeError):
-        pass
-    
-    # Method 2: Try mmdc command directly
-    if not found:
+    return "Node.js Environment", lines
+
+_npm_globals = None
+
+async def npm_global_packages() -> dict:
+    """Return the globally installed npm packages, keyed by package name."""
+    global _npm_globals
+    if _npm_globals is None:
+        result = await run_tool('npm', 'list', '-g', '--depth=0', '--json', timeout=15)
         try:
-            result = subprocess.run(['mmdc', '--version'], 
-                                  capture_output=True, text=True, timeout=10, 
-                                  shell=True, encoding='utf-8', errors='ignore')
-            if result.returncode == 0 and result.stdout:
-                print(f"✅ mmdc: {result.stdout.strip()}")
-                found = True
-        except (subprocess.TimeoutExpired, FileNotFoundError, UnicodeDecodeError):
-            print("❌ mmdc: Command not found in PATH")
+            _npm_globals = json.loads(result.stdout).get('dependencies', {}) if result else {}
+        except ValueError:
+            _npm_globals = {}
+    return _npm_globals
+
+async def _mermaid_from_npm_list():
+    """Check via npm list global packages."""
+    package = (await npm_global_packages()).get('@mermaid-js/mermaid-cli')
+    if package is None:
+        return None
+    return ["✅ @mermaid-js/mermaid-cli: Found in global packages",
+            f"   @mermaid-js/mermaid-cli@{package.get('version', 'unknown')}"]
+
+async def _mermaid_from_mmdc():
+    """Try mmdc command directly."""
+    result = await run_tool('mmdc', '--version')
+    if result is not None and result.returncode == 0 and result.stdout:
+        return [f"✅ mmdc: {result.stdout.strip()}"]
+    return None
+
+def _npm_global_roots():
+    """Return candidate global node_modules directories."""
+    roots = [
+        os.path.join(os.path.expanduser('~'), '.npm-global', 'lib', 'node_modules'),
+        '/usr/local/lib/node_modules',
+        '/usr/lib/node_modules',
+    ]
+    if os.environ.get('APPDATA'):
+        roots.insert(0, os.path.join(os.environ['APPDATA'], 'npm', 'node_modules'))
+    if os.environ.get('NPM_CONFIG_PREFIX'):
+        prefix = os.environ['NPM_CONFIG_PREFIX']
+        roots[:0] = [os.path.join(prefix, 'node_modules'),
+                     os.path.join(prefix, 'lib', 'node_modules')]
+    node = resolve('node')
+    if node is not None:
+        # npm installs global packages next to the node binary by default
+        node_dir = os.path.dirname(os.path.realpath(node))
+        roots.extend([os.path.join(node_dir, 'node_modules'),
+                      os.path.join(os.path.dirname(node_dir), 'lib', 'node_modules')])
+    return roots
+
+async def _mermaid_from_global_prefix():
+    """Look for the package directly in the npm global prefix."""
+    for root in _npm_global_roots():
+        package_json = os.path.join(root, '@mermaid-js', 'mermaid-cli', 'package.json')
+        if os.path.isfile(package_json):
+            try:
+                with open(package_json, 'r', encoding='utf-8') as f:
+                    version = json.load(f).get('version', 'unknown')
+            except (OSError, ValueError):
+                version = 'unknown'
+            return ["✅ Mermaid CLI: Found in npm global prefix",
+                    f"   {root} (@mermaid-js/mermaid-cli@{version})"]
+    return None
+
+async def _mermaid_from_local():
+    """Check local node_modules."""
+    if os.path.isfile(os.path.join('node_modules', '.bin', 'mmdc')):
+        return ["✅ Local mermaid-cli found in node_modules/.bin/"]
+    return None
+
+async def check_mermaid():
+    """Check Mermaid CLI installation."""
+    lines = []
     
-    # Method 3: Simple check - if npm shows the package is installed globally
-    if not found:
-        try:
-            # Simplified check
-            result = subprocess.run(['powershell', '-Command', 
-                                   'npm list -g 2>$null | Select-String "mermaid-cli"'], 
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0 and result.stdout.strip():
-                print("✅ Mermaid CLI: Detected via PowerShell check")
-                print(f"   {result.stdout.strip()}")
-                found = True
-        except:
-            pass
+    # mmdc is a Node.js program, so none of the probes can succeed without node
+    if resolve('node') is None:
+        lines.append("❌ Node.js not installed — skipping Mermaid CLI check")
+        lines.append("💡 Install Node.js from https://nodejs.org/ first")
+        return "Mermaid CLI", lines
     
-    # Method 4: Check local node_modules
-    if not found:
-        local_mmdc = Path('./node_modules/.bin/mmdc')
-        if local_mmdc.exists():
-            print("✅ Local mermaid-cli found in node_modules/.bin/")
-            found = True
+    # Detection methods ordered from cheapest to most expensive: two
+    # filesystem checks, one mmdc launch, then the slow global npm listing
+    probes = [_mermaid_from_local, _mermaid_from_global_prefix,
+              _mermaid_from_mmdc, _mermaid_from_npm_list]
+    found = None
+    for probe in probes:
+        found = await probe()
+        if found:
+            break
     
     if found:
-        print("✅ Mermaid CLI is available for use!")
-        print("💡 Note: CLI detection works, but npm permissions may affect usage")
+        lines.extend(found)
+        lines.append("✅ Mermaid CLI is available for use!")
+        lines.append("💡 Note: CLI detection works, but npm permissions may affect usage")
     else:
-        print("❌ Mermaid CLI not detected")
-        print("\n💡 Troubleshooting:")
-        print("   1. Install: npm install -g @mermaid-js/mermaid-cli")
-        print("   2. Or install locally: npm install @mermaid-js/mermaid-cli")
-        print("   3. Run as Administrator if permission issues persist")
-        print("   4. Check if antivirus is blocking npm operations")
+        lines.append("❌ Mermaid CLI not detected")
+        lines.append("\n💡 Troubleshooting:")
+        lines.append("   1. Install: npm install -g @mermaid-js/mermaid-cli")
+        lines.append("   2. Or install locally: npm install @mermaid-js/mermaid-cli")
+        lines.append("   3. Run as Administrator if permission issues persist")
+        lines.append("   4. Check if antivirus is blocking npm operations")
+    
+    return "Mermaid CLI", lines
 
-def check_files():
+async def check_files():
     """Check project files."""
-    print_header("Project Files")
+    lines = []
     
     required_files = [
         'mermaid_to_png.py',
@@ -165,103 +240,146 @@ def check_files():
         'static/style.css'
     ]
     
+    # List each parent directory once instead of stat-ing every file
+    files_by_parent = defaultdict(list)
     for file_path in required_files:
-        path = Path(file_path)
-        if path.exists():
-            size = path.stat().st_size
-            print(f"✅ {file_path} ({size} bytes)")
+        parent, name = os.path.split(file_path)
+        files_by_parent[parent or '.'].append((file_path, name))
+    
+    entries = {}
+    for parent, files in files_by_parent.items():
+        try:
+            with os.scandir(parent) as it:
+                found = {e.name: e for e in it}
+        except OSError:
+            found = {}
+        for file_path, name in files:
+            entries[file_path] = found.get(name)
+    
+    for file_path in required_files:
+        entry = entries[file_path]
+        if entry is not None and entry.is_file():
+            size = entry.stat().st_size
+            lines.append(f"✅ {file_path} ({size} bytes)")
         else:
-            print(f"❌ {file_path} - Missing")
+            lines.append(f"❌ {file_path} - Missing")
+    
+    return "Project Files", lines
 
-def check_directories():
+async def check_directories():
     """Check required directories."""
-    print_header("Project Directories")
+    lines = []
     
     required_dirs = [
         'templates',
         'static',
-        'examples',
-        'uploads',
-        'outputs'
+        'examples'
     ]
     
     for dir_path in required_dirs:
-        path = Path(dir_path)
-        if path.exists() and path.is_dir():
-            files = list(path.iterdir())
-            print(f"✅ {dir_path}/ ({len(files)} items)")
-        else:
-            print(f"❌ {dir_path}/ - Missing")
-            # Create missing directories
-            try:
-                path.mkdir(exist_ok=True)
-                print(f"   📁 Created {dir_path}/")
-            except Exception as e:
-                print(f"   ⚠️ Could not create: {str(e)}")
+        # Listing the directory doubles as the existence check
+        try:
+            with os.scandir(dir_path) as it:
+                count = sum(1 for _ in it)
+            lines.append(f"✅ {dir_path}/ ({count} items)")
+            continue
+        except FileNotFoundError:
+            lines.append(f"❌ {dir_path}/ - Missing")
+        except NotADirectoryError:
+            lines.append(f"❌ {dir_path}/ - Not a directory")
+            continue
+        except OSError as e:
+            lines.append(f"⚠️ {dir_path}/ - Not readable ({str(e)})")
+            continue
+        # Create missing directories
+        try:
+            os.makedirs(dir_path, exist_ok=True)
+            lines.append(f"   📁 Created {dir_path}/")
+        except OSError as e:
+            lines.append(f"   ⚠️ Could not create: {str(e)}")
+    
+    return "Project Directories", lines
 
-def check_ports():
+async def check_ports():
     """Check if required ports are available."""
-    print_header("Network Ports")
+    lines = []
     
     import socket
     
     def is_port_available(port):
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(1)
-                result = s.connect_ex(('localhost', port))
-                return result != 0
-        except:
-            return False
+        # A bind attempt answers immediately, unlike a connect to a silent port
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            if os.name != 'nt':
+                # On Windows SO_REUSEADDR would let us bind over a live listener
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                s.bind(('localhost', port))
+                return True
+            except OSError:
+                return False
     
     ports = [5000, 8000, 3000]
     for port in ports:
         if is_port_available(port):
-            print(f"✅ Port {port}: Available")
+            lines.append(f"✅ Port {port}: Available")
         else:
-            print(f"⚠️ Port {port}: In use or blocked")
+            lines.append(f"⚠️ Port {port}: In use or blocked")
+    
+    return "Network Ports", lines
 
-def generate_recommendations():
+async def generate_recommendations():
     """Generate recommendations based on checks."""
-    print_header("Recommendations")
-    
-    print("1. 🔧 Environment Setup:")
-    print("   - Ensure Python 3.6+ is installed and in PATH")
-    print("   - Install required Python packages: pip install -r requirements.txt")
-    print("")
-    
-    print("2. 🌐 Web Application:")
-    print("   - Start with: python web_app.py")
-    print("   - Access at: http://localhost:5000")
-    print("")
-    
-    print("3. 📦 Optional - Mermaid CLI:")
-    print("   - Install Node.js from https://nodejs.org/")
-    print("   - Install Mermaid CLI: npm install -g @mermaid-js/mermaid-cli")
-    print("")
-    
-    print("4. 🚀 Quick Start:")
-    print("   - Run: python diagnose.py")
-    print("   - Run: python web_app.py")
-    print("   - Open: http://localhost:5000")
+    lines = [
+        "1. 🔧 Environment Setup:",
+        "   - Ensure Python 3.8+ is installed and in PATH",
+        "   - Install required Python packages: pip install -r requirements.txt",
+        "",
+        "2. 🌐 Web Application:",
+        "   - Start with: python web_app.py",
+        "   - Access at: http://localhost:5000",
+        "",
+        "3. 📦 Optional - Mermaid CLI:",
+        "   - Install Node.js from https://nodejs.org/",
+        "   - Install Mermaid CLI: npm install -g @mermaid-js/mermaid-cli",
+        "",
+        "4. 🚀 Quick Start:",
+        "   - Run: python diagnose.py",
+        "   - Run: python web_app.py",
+        "   - Open: http://localhost:5000",
+    ]
+    return "Recommendations", lines
+
+async def gather_checks():
+    """Run all checks concurrently and return their (title, lines) results."""
+    return await asyncio.gather(
+        check_python(),
+        check_modules(),
+        check_node(),
+        check_mermaid(),
+        check_files(),
+        check_directories(),
+        check_ports(),
+        generate_recommendations(),
+    )
 
 def main():
     """Main diagnostic function."""
-    print("🔍 Mermaid to PNG Environment Diagnostic")
-    print(f"Running on: {platform.system()} {platform.release()}")
+    out = [
+        "🔍 Mermaid to PNG Environment Diagnostic",
+        f"Running on: {_SYSREL}",
+    ]
+    
+    # Run every check concurrently; gather returns results in call order
+    results = asyncio.run(gather_checks())
+    for title, lines in results:
+        out.append(format_header(title))
+        out.extend(lines)
     
-    check_python()
-    check_modules()
-    check_node()
-    check_mermaid()
-    check_files()
-    check_directories()
-    check_ports()
-    generate_recommendations()
+    out.append(format_header("Diagnostic Complete"))
     
-    print(f"\n{'='*60}")
-    print(" Diagnostic Complete")
-    print(f"{'='*60}")
+    # Write the whole report at once rather than one console write per line
+    sys.stdout.write("\n".join(out) + "\n")
+    sys.stdout.flush()
 
 if __name__ == '__main__':
     main()
@@ -7,7 +7,7 @@ This script converts Mermaid diagram code to PNG images using the Mermaid CLI.
 It supports both single file conversion and batch conversion of multiple files.
 
 Requirements:
-- Python 3.6+
+- Python 3.8+
 - Node.js and npm
 - @mermaid-js/mermaid-cli package
 
@@ -16,132 +16,359 @@ Date: July 2025
 """
 
 import os
+import re
 import sys
 import argparse
 import subprocess
 import json
+import logging
+import queue
 from pathlib import Path
 import tempfile
 import shutil
+import hashlib
+import base64
+import atexit
+import threading
+import time
+import contextlib
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 # Add demo mode support
 from PIL import Image, ImageDraw, ImageFont
 import io
 
 
+logger = logging.getLogger(__name__)
+
+# First keyword of every supported diagram type; used to reject junk input
+# before paying for a browser start-up
+_DIAGRAM_RE = re.compile(
+    r'^\s*(graph|flowchart|sequenceDiagram|classDiagram|stateDiagram|erDiagram'
+    r'|journey|gantt|pie|gitGraph|mindmap|timeline|quadrantChart|requirementDiagram'
+    r'|C4Context|C4Container|C4Component|C4Dynamic|C4Deployment'
+    r'|sankey|xychart|block|packet|architecture|kanban|zenuml)\b',
+    re.MULTILINE | re.IGNORECASE
+)
+
+
+def is_mermaid_diagram(mermaid_code):
+    """Return True if the text starts a line with a Mermaid diagram keyword."""
+    # Python's \s does not match a byte order mark, unlike mmdc's JavaScript
+    mermaid_code = mermaid_code.lstrip('\ufeff')
+    return bool(mermaid_code.strip()) and _DIAGRAM_RE.search(mermaid_code) is not None
+
+
+def _load_font(size):
+    """Load Arial at the given size, falling back to PIL's default font."""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+# Fonts for demo images, loaded once instead of on every render
+_FONT_LARGE = _load_font(24)
+_FONT_MEDIUM = _load_font(16)
+_FONT_SMALL = _load_font(12)
+
+# Static part of the demo image, drawn on first use
+_DEMO_BACKGROUND = None
+
+
+def _demo_background():
+    """Return the demo image without the per-diagram code snippet."""
+    global _DEMO_BACKGROUND
+    if _DEMO_BACKGROUND is not None:
+        return _DEMO_BACKGROUND
+    
+    # Create a simple demonstration image
+    width, height = 800, 600
+    img = Image.new('RGB', (width, height), color='white')
+    draw = ImageDraw.Draw(img)
+    
+    # Draw demo content
+    draw.rectangle([50, 50, width-50, height-50], outline='#333', width=2)
+    
+    # Title
+    draw.text((width//2-100, 80), "Mermaid Diagram", fill='#333', font=_FONT_LARGE)
+    draw.text((width//2-80, 110), "(Demo Mode)", fill='#666', font=_FONT_MEDIUM)
+    
+    # Draw some basic shapes to represent a diagram
+    # Box 1
+    draw.rectangle([150, 200, 300, 250], outline='#3498db', width=2, fill='#ecf0f1')
+    draw.text((225-30, 220), "Start", fill='#2c3e50', font=_FONT_MEDIUM)
+    
+    # Arrow
+    draw.line([300, 225, 350, 225], fill='#333', width=2)
+    draw.polygon([(345, 220), (355, 225), (345, 230)], fill='#333')
+    
+    # Box 2
+    draw.rectangle([400, 200, 550, 250], outline='#e74c3c', width=2, fill='#fadbd8')
+    draw.text((475-30, 220), "Process", fill='#2c3e50', font=_FONT_MEDIUM)
+    
+    # Arrow down
+    draw.line([475, 250, 475, 300], fill='#333', width=2)
+    draw.polygon([(470, 295), (475, 305), (480, 295)], fill='#333')
+    
+    # Box 3
+    draw.rectangle([400, 350, 550, 400], outline='#27ae60', width=2, fill='#d5f4e6')
+    draw.text((475-20, 370), "End", fill='#2c3e50', font=_FONT_MEDIUM)
+    
+    # Code snippet heading; the lines themselves are added per diagram
+    draw.text((100, 450), "Original Mermaid Code:", fill='#7f8c8d', font=_FONT_SMALL)
+    
+    # Note
+    draw.text((100, 550), "Note: Install Mermaid CLI for actual conversion", fill='#e67e22', font=_FONT_SMALL)
+    
+    _DEMO_BACKGROUND = img
+    return img
+
+
+def _first_lines(text, count, width):
+    """
+    Return up to count lines of text, each cut to width characters.
+    
+    Matches text.split('\n')[:count] but only ever copies count*width
+    characters, however large the input is.
+    """
+    lines = []
+    start = 0
+    while len(lines) < count:
+        end = text.find('\n', start)
+        if end == -1:
+            lines.append(text[start:start + width])
+            break
+        lines.append(text[start:min(end, start + width)])
+        start = end + 1
+    return lines
+
+
+@functools.lru_cache(maxsize=64)
+def _demo_png(snippet):
+    """Encode the demo image for a tuple of snippet lines, memoised per snippet."""
+    img = _demo_background().copy()
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(snippet):
+        if line.strip():
+            draw.text((100, 450 + 20 + i*15), line[:50], fill='#95a5a6', font=_FONT_SMALL)
+    buf = io.BytesIO()
+    img.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+# Node.js helper that keeps one browser open across conversions
+DAEMON_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mmdc_daemon.mjs")
+
+
+class RenderError(Exception):
+    """Raised when a renderer is working but rejects the diagram itself."""
+
+
+class MmdcPool:
+    """
+    Pool of persistent renderers shared by all threads.
+    
+    Each renderer handles one request at a time, so concurrent conversions
+    take a free renderer from the queue instead of waiting on a single one.
+    Renderers are started only when every existing one is busy, so a single
+    conversion boots a single browser.
+    """
+    
+    def __init__(self, start, size=None):
+        """
+        Args:
+            start (callable): Returns a new renderer process, or None
+            size (int): Maximum number of renderers; defaults to
+                MMDC_POOL_SIZE or min(4, CPU count)
+        """
+        if size is None:
+            size = min(4, os.cpu_count() or 1)
+            env_size = os.environ.get("MMDC_POOL_SIZE")
+            if env_size:
+                try:
+                    size = int(env_size)
+                except ValueError:
+                    logger.warning("⚠️ Ignoring invalid MMDC_POOL_SIZE=%r, using %d", env_size, size)
+        self._start = start
+        self._size = max(1, size)
+        self._q = queue.Queue()
+        self._count = 0
+        self._lock = threading.Lock()
+    
+    def _acquire(self):
+        """
+        Take an idle renderer, starting a new one if all are busy.
+        
+        Returns:
+            subprocess.Popen: A renderer, or None (a slot telling the
+            caller to fall back to mmdc)
+        """
+        try:
+            return self._q.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._lock:
+            grow = self._count < self._size
+            if grow:
+                self._count += 1
+        if not grow:
+            # Every slot is taken and each one is put back after use
+            return self._q.get()
+        
+        proc = None
+        try:
+            proc = self._start()
+        except Exception as e:
+            logger.warning("⚠️ Could not start Mermaid renderer: %s", e)
+        if proc is None:
+            # Renderers cannot run here, so stop trying to start more
+            with self._lock:
+                self._count = self._size
+        return proc
+    
+    def render(self, code, config):
+        """
+        Render a diagram on the next free renderer.
+        
+        Returns:
+            bytes: The PNG data, or None if no renderer is available and the
+            caller should fall back to running mmdc directly
+            
+        Raises:
+            RenderError: If the renderer failed on this diagram; mmdc
+            would fail on it too
+        """
+        request = json.dumps({"code": code, "config": config or {}}) + "\n"
+        
+        # Start lazily so CLI runs that never convert don't boot a browser
+        proc = self._acquire()
+        line = b""
+        try:
+            if proc is not None:
+                proc.stdin.write(request.encode('utf-8'))
+                proc.stdin.flush()
+                line = proc.stdout.readline()
+        except OSError:
+            pass
+        finally:
+            if proc is not None and not line:
+                logger.warning("⚠️ Mermaid renderer exited, falling back to mmdc")
+                proc.kill()
+                proc = None
+            self._q.put(proc)
+        
+        if not line:
+            return None
+        
+        try:
+            response = json.loads(line)
+            if "error" not in response:
+                return base64.b64decode(response["png_b64"])
+        except (ValueError, KeyError) as e:
+            logger.error("❌ Invalid renderer response: %s", e)
+            return None
+        raise RenderError(response["error"])
+
+
 class MermaidConverter:
     """Mermaid diagram to PNG converter class."""
     
+    # Maximum number of rendered PNGs kept in memory
+    MEMORY_CACHE_SIZE = 256
+    # Maximum number of rendered PNGs kept in .mmd_cache on disk
+    DISK_CACHE_SIZE = 1024
+    # Seconds before a failed dependency check is tried again
+    RECHECK_INTERVAL = 60
+    
     def __init__(self):
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        self._cache_dir = Path(script_dir) / ".mmd_cache"
+        self._memory_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._mmdc_version = None
+        self._pool = MmdcPool(self._start_daemon)
+        # Keep short-lived config files in RAM where a tmpfs is available
+        self._temp_dir = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
         self.mermaid_cli = self._find_mermaid_cli()
         self.demo_mode = self.mermaid_cli is None
         if self.demo_mode:
-            print("⚠️ Mermaid CLI not available - running in demo mode")
-            print("💡 Demo mode will generate placeholder images")
+            logger.warning("⚠️ Mermaid CLI not available - running in demo mode")
+            logger.info("💡 Demo mode will generate placeholder images")
+        # Verified on the first conversion rather than at start-up
+        self._verified = False
+        self._verified_at = 0.0
+        self._deps_ok = False
+        self._verify_lock = threading.Lock()
     
     def _find_mermaid_cli(self):
-        """Find the mermaid CLI executable."""
-        # Try different possible locations - prioritize local installations
+        """
+        Find the mermaid CLI executable.
+        
+        Only looks at the filesystem; the CLI is verified on first use,
+        and conversion failures already fall back to demo mode.
+        """
+        # Local installations take priority over the global one
         script_dir = os.path.dirname(os.path.abspath(__file__))
+        bin_dir = os.path.join(script_dir, "node_modules", ".bin")
+        
+        cli_path = None
+        for ext in (".cmd", ""):
+            candidate = os.path.join(bin_dir, "mmdc" + ext)
+            if os.path.isfile(candidate):
+                cli_path = candidate
+                break
+        else:
+            cli_path = shutil.which("mmdc")
+        
+        if cli_path is None:
+            return None
         
-        possible_paths = [
-            # Local installations (highest priority)
-            os.path.join(script_dir, "node_modules", ".bin", "mmdc.cmd"),
-            os.path.join(script_dir, "node_modules", ".bin", "mmdc"),
-            os.path.join(script_dir, "node_modules", ".bin", "mmdc.ps1"),
-            # Node.js CLI direct access
-            f"node {os.path.join(script_dir, 'node_modules', '@mermaid-js', 'mermaid-cli', 'dist', 'cli.js')}",
-            # Global installations
-            "mmdc",
-            "npx @mermaid-js/mermaid-cli",
+        self._mmdc_version = self._read_mmdc_version(cli_path)
+        logger.info("✅ Found Mermaid CLI: %s", cli_path)
+        if self._mmdc_version:
+            logger.debug("  Version: %s", self._mmdc_version)
+        return cli_path
+    
+    @staticmethod
+    def _read_mmdc_version(cli_path):
+        """Read the mermaid-cli version from its package.json, if it can be found."""
+        # A .cmd shim lives next to node_modules (global) or inside
+        # node_modules/.bin (local); on POSIX mmdc is a symlink into the package
+        cli_dir = os.path.dirname(cli_path)
+        candidates = [
+            os.path.join(cli_dir, "node_modules", "@mermaid-js", "mermaid-cli", "package.json"),
+            os.path.join(cli_dir, "..", "@mermaid-js", "mermaid-cli", "package.json"),
+            os.path.join(cli_dir, "..", "lib", "node_modules", "@mermaid-js", "mermaid-cli", "package.json"),
         ]
+        real_dir = os.path.dirname(os.path.realpath(cli_path))
+        candidates.append(os.path.join(real_dir, "..", "package.json"))
         
-        for path in possible_paths:
+        for package_json in candidates:
             try:
-                print(f"Testing: {path}")
-                
-                # Handle Node.js direct calls differently
-                if path.startswith("node "):
-                    # Check if the JS file exists first
-                    js_file = path.replace("node ", "")
-                    if not os.path.exists(js_file):
-                        print(f"  JS file not found: {js_file}")
-                        continue
-                    
-                    result = subprocess.run(
-                        f"{path} --version",
-                        shell=True,
-                        capture_output=True,
-                        text=True,
-                        timeout=15,
-                        encoding='utf-8',
-                        errors='ignore'
-                    )
-                
-                elif "npx" in path:
-                    # For npx, first check if package is available without running
-                    check_cmd = "npm list @mermaid-js/mermaid-cli"
-                    check_result = subprocess.run(
-                        check_cmd,
-                        shell=True,
-                        capture_output=True,
-                        text=True,
-                        timeout=10,
-                        encoding='utf-8',
-                        errors='ignore'
-                    )
-                    if check_result.stdout and "@mermaid-js/mermaid-cli" in check_result.stdout:
-                        print(f"  Found via npm list: {path}")
-                        return path
-                    else:
-                        print(f"  Package not found in npm list")
-                        continue
-                
-                else:
-                    # Direct command execution
-                    result = subprocess.run(
-                        f'"{path}" --version',
-                        shell=True,
-                        capture_output=True,
-                        text=True,
-                        timeout=10,
-                        encoding='utf-8',
-                        errors='ignore'
-                    )
-                
-                if result.returncode == 0 and result.stdout:
-                    # Additional test: try actual conversion
-                    if self._test_mermaid_cli_with_conversion(path):
-                        print(f"✅ Found working Mermaid CLI: {path}")
-                        print(f"  Version: {result.stdout.strip()}")
-                        return path
-                    else:
-                        print(f"  Version check passed but conversion failed")
-                        continue
-                else:
-                    print(f"  Failed: return code {result.returncode}")
-                    if result.stderr:
-                        print(f"  Error: {result.stderr[:100]}...")
-                        
-            except (subprocess.TimeoutExpired, FileNotFoundError, Exception) as e:
-                print(f"  Exception: {type(e).__name__}: {str(e)[:100]}")
+                with open(package_json, 'r', encoding='utf-8') as f:
+                    package = json.load(f)
+            except (OSError, ValueError):
                 continue
-                
+            if package.get("name") == "@mermaid-js/mermaid-cli":
+                return package.get("version")
         return None
     
     def _check_dependencies(self):
         """Check if required dependencies are installed."""
         if not self.mermaid_cli:
-            print("❌ Mermaid CLI not found!")
-            print("Please install it using one of these methods:")
-            print("1. Global installation: npm install -g @mermaid-js/mermaid-cli")
-            print("2. Local installation: npm install @mermaid-js/mermaid-cli")
+            logger.error("❌ Mermaid CLI not found!\n"
+                         "Please install it using one of these methods:\n"
+                         "1. Global installation: npm install -g @mermaid-js/mermaid-cli\n"
+                         "2. Local installation: npm install @mermaid-js/mermaid-cli")
             return False
             
         # Check if puppeteer dependencies are available
         try:
             result = subprocess.run(
-                f"{self.mermaid_cli} --help",
-                shell=True,
+                [self.mermaid_cli, "--help"],
                 capture_output=True,
                 text=True,
                 timeout=10,
@@ -149,15 +376,48 @@ class MermaidConverter:
                 errors='ignore'
             )
             if result.returncode != 0:
-                print("❌ Mermaid CLI is not working properly")
+                logger.error("❌ Mermaid CLI is not working properly")
                 return False
         except subprocess.TimeoutExpired:
-            print("❌ Mermaid CLI is not responding")
+            logger.error("❌ Mermaid CLI is not responding")
+            return False
+        except OSError as e:
+            logger.error("❌ Mermaid CLI could not be started: %s", e)
             return False
             
-        print("✅ All dependencies are available")
+        logger.debug("✅ All dependencies are available")
         return True
     
+    def verify_dependencies(self):
+        """Run the dependency check now and use its result for conversions."""
+        with self._verify_lock:
+            self._deps_ok = self._check_dependencies()
+            self._verified_at = time.monotonic()
+            self._verified = True
+        return self._deps_ok
+    
+    def _needs_verification(self):
+        """True before the first check, and again a while after a failed one."""
+        if not self._verified:
+            return True
+        return not self._deps_ok and time.monotonic() - self._verified_at >= self.RECHECK_INTERVAL
+    
+    def _ensure_verified(self):
+        """
+        Run the dependency check the first time it is needed.
+        
+        A failed check (e.g. mmdc timing out during a slow cold start) is
+        retried after RECHECK_INTERVAL instead of lasting until restart.
+        """
+        if self._needs_verification():
+            # Concurrent conversions wait for a single check
+            with self._verify_lock:
+                if self._needs_verification():
+                    self._deps_ok = self._check_dependencies()
+                    self._verified_at = time.monotonic()
+                    self._verified = True
+        return self._deps_ok
+    
     def convert_mermaid_text(self, mermaid_code, output_path, config=None):
         """
         Convert Mermaid code text to PNG image.
@@ -170,90 +430,267 @@ class MermaidConverter:
         Returns:
             bool: True if conversion successful, False otherwise
         """
+        return self._convert(mermaid_code, output_path, config)[0]
+    
+    def render_png(self, mermaid_code, config=None):
+        """
+        Render Mermaid code and return the PNG bytes.
+        
+        Args:
+            mermaid_code (str): The Mermaid diagram code
+            config (dict): Optional configuration for Mermaid
+            
+        Returns:
+            tuple: (png_data, rendered) where png_data is None if conversion
+            failed, and rendered is False when png_data is a demo placeholder
+            rather than a real Mermaid render
+        """
+        # Serve repeat diagrams straight from memory, without a temp file
+        if not self.demo_mode and is_mermaid_diagram(mermaid_code):
+            png_data = self._recall(self._cache_key(mermaid_code, config))
+            if png_data is not None:
+                return png_data, True
+        
+        with tempfile.NamedTemporaryFile(suffix='.png', delete=False, dir=self._temp_dir) as temp_file:
+            output_path = temp_file.name
+        try:
+            success, rendered = self._convert(mermaid_code, output_path, config)
+            if not success:
+                return None, False
+            return Path(output_path).read_bytes(), rendered
+        finally:
+            Path(output_path).unlink(missing_ok=True)
+    
+    def _convert(self, mermaid_code, output_path, config):
+        """
+        Convert Mermaid code to a PNG at output_path.
+        
+        Returns:
+            tuple: (success, rendered) where rendered is False if a demo
+            placeholder was written instead of a real render
+        """
+        if not is_mermaid_diagram(mermaid_code):
+            logger.error("❌ Input is not a Mermaid diagram")
+            return False, False
+        
         # Check if we should use demo mode
         if self.demo_mode:
-            print("🎭 Using demo mode - generating placeholder image")
-            return self._create_demo_image(mermaid_code, output_path)
+            logger.debug("🎭 Using demo mode - generating placeholder image")
+            return self._create_demo_image(mermaid_code, output_path), False
         
-        if not self._check_dependencies():
-            print("⚠️ Dependencies not available, trying demo mode")
-            return self._create_demo_image(mermaid_code, output_path)
-            
-        # Create temporary file for mermaid code
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.mmd', delete=False, encoding='utf-8') as temp_file:
-            temp_file.write(mermaid_code)
-            temp_input = temp_file.name
+        # Identical diagrams render to identical PNGs, so reuse earlier output
+        cache_key = self._cache_key(mermaid_code, config)
+        if self._load_from_cache(cache_key, output_path):
+            logger.debug("✅ Served %s from cache", output_path)
+            return True, True
         
+        if not self._ensure_verified():
+            logger.warning("⚠️ Dependencies not available, trying demo mode")
+            return self._create_demo_image(mermaid_code, output_path), False
+        
+        # Prefer the persistent renderer; fall back to a one-off mmdc run
+        # only when no renderer is available, not when the diagram is bad
         try:
-            # Prepare command
-            if self.mermaid_cli.startswith("node "):
-                # Direct Node.js command
-                cmd = [self.mermaid_cli, "-i", temp_input, "-o", output_path]
-                cmd = " ".join(cmd)
-            else:
-                cmd = [self.mermaid_cli, "-i", temp_input, "-o", output_path]
-            
-            # Add configuration if provided
-            config_file_path = None
-            if config:
-                config_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8')
-                json.dump(config, config_file, indent=2)
-                config_file.close()
-                config_file_path = config_file.name
-                if isinstance(cmd, list):
-                    cmd.extend(["-c", config_file_path])
-                else:
-                    cmd += f" -c {config_file_path}"
+            if self._render_with_daemon(mermaid_code, output_path, config):
+                logger.info("✅ Successfully converted to %s", output_path)
+                self._store_in_cache(cache_key, output_path)
+                return True, True
+        except RenderError as e:
+            logger.error("❌ Renderer error: %s", str(e)[:200])
+            logger.warning("🔄 Falling back to demo mode")
+            return self._create_demo_image(mermaid_code, output_path), False
             
-            # Convert shell command if using npx or node
-            if "npx" in self.mermaid_cli or self.mermaid_cli.startswith("node "):
-                if isinstance(cmd, list):
-                    cmd = " ".join(cmd)
+        # Temporary files are removed when the stack unwinds
+        with contextlib.ExitStack() as stack:
+            try:
+                # Prepare command; the diagram itself is piped in on stdin
+                cmd = [self.mermaid_cli, "-i", "-", "-o", output_path]
                 
-            # Run conversion
-            print(f"Converting to {output_path}...")
-            print(f"Command: {cmd if isinstance(cmd, str) else ' '.join(cmd)}")
-            
-            result = subprocess.run(
-                cmd,
-                shell=isinstance(cmd, str),
-                capture_output=True,
-                text=True,
-                timeout=45,  # Increased timeout
-                encoding='utf-8',
-                errors='ignore'
+                # Add configuration if provided
+                if config:
+                    config_file = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False,
+                                                              encoding='utf-8', dir=self._temp_dir)
+                    json.dump(config, config_file, indent=2)
+                    config_file.close()
+                    stack.callback(Path(config_file.name).unlink, missing_ok=True)
+                    cmd.extend(["-c", config_file.name])
+                
+                # Run conversion
+                logger.debug("Converting to %s...", output_path)
+                logger.debug("Command: %s", cmd)
+                
+                result = subprocess.run(
+                    cmd,
+                    input=mermaid_code,
+                    capture_output=True,
+                    text=True,
+                    timeout=45,  # Increased timeout
+                    encoding='utf-8',
+                    errors='ignore'
+                )
+                
+                if result.returncode == 0 and os.path.exists(output_path):
+                    logger.info("✅ Successfully converted to %s", output_path)
+                    self._store_in_cache(cache_key, output_path)
+                    return True, True
+                else:
+                    logger.error("❌ Conversion failed (return code: %s)", result.returncode)
+                    if result.stderr:
+                        logger.error("Error: %s...", result.stderr[:200])
+                    if result.stdout:
+                        logger.debug("Output: %s...", result.stdout[:200])
+                    
+                    # Fallback to demo mode if CLI fails
+                    logger.warning("🔄 Falling back to demo mode")
+                    return self._create_demo_image(mermaid_code, output_path), False
+                    
+            except subprocess.TimeoutExpired:
+                logger.error("❌ Conversion timed out, using demo mode")
+                return self._create_demo_image(mermaid_code, output_path), False
+            except Exception as e:
+                logger.error("❌ Error during conversion: %s", e)
+                logger.warning("🔄 Falling back to demo mode")
+                return self._create_demo_image(mermaid_code, output_path), False
+    
+    def _start_daemon(self):
+        """
+        Start the persistent renderer in mmdc_daemon.mjs.
+        
+        The daemon imports mermaid-cli and puppeteer from the local
+        node_modules, so it is only used for a local installation.
+        
+        Returns:
+            subprocess.Popen: The daemon process, or None if it cannot run
+        """
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        package_dir = os.path.join(script_dir, "node_modules", "@mermaid-js", "mermaid-cli")
+        node = shutil.which("node")
+        if node is None or not os.path.isdir(package_dir) or not os.path.exists(DAEMON_SCRIPT):
+            return None
+        
+        try:
+            proc = subprocess.Popen(
+                [node, DAEMON_SCRIPT],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=script_dir
             )
+        except OSError as e:
+            logger.warning("⚠️ Could not start Mermaid renderer: %s", e)
+            return None
+        
+        atexit.register(proc.terminate)
+        logger.info("✅ Started persistent Mermaid renderer")
+        return proc
+    
+    def _render_with_daemon(self, mermaid_code, output_path, config):
+        """
+        Render through the pool of persistent renderers.
+        
+        Returns:
+            bool: True if the PNG was written, False if the caller should
+            fall back to running mmdc directly
             
-            if result.returncode == 0 and os.path.exists(output_path):
-                print(f"✅ Successfully converted to {output_path}")
+        Raises:
+            RenderError: If the renderer failed on this diagram
+        """
+        png_data = self._pool.render(mermaid_code, config)
+        if png_data is None:
+            return False
+        try:
+            with open(output_path, 'wb') as f:
+                f.write(png_data)
+            return True
+        except OSError as e:
+            logger.error("❌ Could not write %s: %s", output_path, e)
+            return False
+    
+    def _cache_key(self, mermaid_code, config):
+        """Return the content hash identifying a rendered diagram."""
+        payload = (mermaid_code
+                   + json.dumps(config or {}, sort_keys=True)
+                   + (self._mmdc_version or ''))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _load_from_cache(self, cache_key, output_path):
+        """Write a previously rendered PNG to output_path if one is cached."""
+        try:
+            png_data = self._recall(cache_key)
+            if png_data is not None:
+                with open(output_path, 'wb') as f:
+                    f.write(png_data)
                 return True
-            else:
-                print(f"❌ Conversion failed (return code: {result.returncode})")
-                if result.stderr:
-                    print(f"Error: {result.stderr[:200]}...")
-                if result.stdout:
-                    print(f"Output: {result.stdout[:200]}...")
-                
-                # Fallback to demo mode if CLI fails
-                print("🔄 Falling back to demo mode")
-                return self._create_demo_image(mermaid_code, output_path)
-                
-        except subprocess.TimeoutExpired:
-            print("❌ Conversion timed out, using demo mode")
-            return self._create_demo_image(mermaid_code, output_path)
-        except Exception as e:
-            print(f"❌ Error during conversion: {str(e)}")
-            print("🔄 Falling back to demo mode")
-            return self._create_demo_image(mermaid_code, output_path)
-        finally:
-            # Clean up temporary files
+            
+            cached = self._cache_dir / f"{cache_key}.png"
+            if cached.exists():
+                png_data = cached.read_bytes()
+                with open(output_path, 'wb') as f:
+                    f.write(png_data)
+                self._remember(cache_key, png_data)
+                return True
+        except FileNotFoundError:
+            # Evicted between the existence check and the read
+            pass
+        except OSError as e:
+            logger.warning("⚠️ Could not read from cache: %s", e)
+        return False
+    
+    def _store_in_cache(self, cache_key, output_path):
+        """Save a freshly rendered PNG in the memory and disk caches."""
+        try:
+            with open(output_path, 'rb') as f:
+                png_data = f.read()
+            self._remember(cache_key, png_data)
+            
+            # Write under a temporary name and rename it into place, so
+            # other threads never read a half-written cache file
+            self._cache_dir.mkdir(exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self._cache_dir)
             try:
-                if os.path.exists(temp_input):
-                    os.unlink(temp_input)
-                if config_file_path and os.path.exists(config_file_path):
-                    os.unlink(config_file_path)
-            except:
-                pass
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(png_data)
+                os.replace(temp_path, self._cache_dir / f"{cache_key}.png")
+            except BaseException:
+                Path(temp_path).unlink(missing_ok=True)
+                raise
+            self._prune_disk_cache()
+        except OSError as e:
+            logger.warning("⚠️ Could not write to cache: %s", e)
+    
+    def _prune_disk_cache(self):
+        """Delete the oldest cached PNGs once DISK_CACHE_SIZE is exceeded."""
+        with os.scandir(self._cache_dir) as it:
+            entries = [entry for entry in it if entry.name.endswith('.png')]
+        if len(entries) <= self.DISK_CACHE_SIZE:
+            return
+        
+        aged = []
+        for entry in entries:
+            try:
+                aged.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                # Already removed by another thread
+                continue
+        aged.sort()
+        for _, path in aged[:len(aged) - self.DISK_CACHE_SIZE]:
+            Path(path).unlink(missing_ok=True)
+    
+    def _recall(self, cache_key):
+        """Return the PNG kept in memory for cache_key, or None."""
+        with self._cache_lock:
+            png_data = self._memory_cache.get(cache_key)
+            if png_data is not None:
+                self._memory_cache.move_to_end(cache_key)
+            return png_data
+    
+    def _remember(self, cache_key, png_data):
+        """Keep png_data in memory, evicting the least recently used entry when full."""
+        with self._cache_lock:
+            self._memory_cache[cache_key] = png_data
+            self._memory_cache.move_to_end(cache_key)
+            if len(self._memory_cache) > self.MEMORY_CACHE_SIZE:
+                self._memory_cache.popitem(last=False)
     
     def convert_file(self, input_file, output_file=None, config=None):
         """
@@ -270,20 +707,21 @@ class MermaidConverter:
         input_path = Path(input_file)
         
         if not input_path.exists():
-            print(f"❌ Input file not found: {input_file}")
+            logger.error("❌ Input file not found: %s", input_file)
             return False
             
         if output_file is None:
             output_file = input_path.with_suffix('.png')
         
         try:
-            with open(input_path, 'r', encoding='utf-8') as f:
+            # utf-8-sig drops the BOM Notepad and PowerShell often write
+            with open(input_path, 'r', encoding='utf-8-sig') as f:
                 mermaid_code = f.read()
             
             return self.convert_mermaid_text(mermaid_code, str(output_file), config)
             
         except Exception as e:
-            print(f"❌ Error reading file {input_file}: {str(e)}")
+            logger.error("❌ Error reading file %s: %s", input_file, e)
             return False
     
     def batch_convert(self, input_directory, output_directory=None, config=None):
@@ -301,7 +739,7 @@ class MermaidConverter:
         input_path = Path(input_directory)
         
         if not input_path.exists() or not input_path.is_dir():
-            print(f"❌ Input directory not found: {input_directory}")
+            logger.error("❌ Input directory not found: %s", input_directory)
             return 0, 0
         
         if output_directory:
@@ -313,145 +751,36 @@ class MermaidConverter:
         mmd_files = list(input_path.glob("*.mmd"))
         
         if not mmd_files:
-            print(f"❌ No .mmd files found in {input_directory}")
+            logger.error("❌ No .mmd files found in %s", input_directory)
             return 0, 0
         
-        successful = 0
         total = len(mmd_files)
         
-        print(f"Found {total} .mmd files to convert...")
+        logger.info("Found %d .mmd files to convert...", total)
         
-        for mmd_file in mmd_files:
-            output_file = output_path / f"{mmd_file.stem}.png"
-            if self.convert_file(str(mmd_file), str(output_file), config):
-                successful += 1
+        # Each conversion mostly waits on its own renderer process, so
+        # threads are enough to overlap them
+        tasks = [(str(mmd_file), str(output_path / f"{mmd_file.stem}.png")) for mmd_file in mmd_files]
+        with ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, total)) as executor:
+            results = list(executor.map(lambda task: self.convert_file(*task, config=config), tasks))
+        successful = sum(results)
         
-        print(f"\n✅ Conversion complete: {successful}/{total} files converted successfully")
+        logger.debug("✅ Conversion complete: %d/%d files converted successfully", successful, total)
         return successful, total
     
     def _create_demo_image(self, mermaid_code, output_path):
         """Create a demo image when Mermaid CLI is not available."""
         try:
-            # Try to import PIL for demo images
-            from PIL import Image, ImageDraw, ImageFont
-        except ImportError:
-            print("❌ PIL not available for demo mode")
-            return False
-        
-        try:
-            # Create a simple demonstration image
-            width, height = 800, 600
-            img = Image.new('RGB', (width, height), color='white')
-            draw = ImageDraw.Draw(img)
-            
-            # Try to use a system font
-            try:
-                font_large = ImageFont.truetype("arial.ttf", 24)
-                font_medium = ImageFont.truetype("arial.ttf", 16)
-                font_small = ImageFont.truetype("arial.ttf", 12)
-            except:
-                # Fallback to default font
-                font_large = ImageFont.load_default()
-                font_medium = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-            
-            # Draw demo content
-            draw.rectangle([50, 50, width-50, height-50], outline='#333', width=2)
-            
-            # Title
-            draw.text((width//2-100, 80), "Mermaid Diagram", fill='#333', font=font_large)
-            draw.text((width//2-80, 110), "(Demo Mode)", fill='#666', font=font_medium)
-            
-            # Draw some basic shapes to represent a diagram
-            # Box 1
-            draw.rectangle([150, 200, 300, 250], outline='#3498db', width=2, fill='#ecf0f1')
-            draw.text((225-30, 220), "Start", fill='#2c3e50', font=font_medium)
-            
-            # Arrow
-            draw.line([300, 225, 350, 225], fill='#333', width=2)
-            draw.polygon([(345, 220), (355, 225), (345, 230)], fill='#333')
-            
-            # Box 2
-            draw.rectangle([400, 200, 550, 250], outline='#e74c3c', width=2, fill='#fadbd8')
-            draw.text((475-30, 220), "Process", fill='#2c3e50', font=font_medium)
-            
-            # Arrow down
-            draw.line([475, 250, 475, 300], fill='#333', width=2)
-            draw.polygon([(470, 295), (475, 305), (480, 295)], fill='#333')
-            
-            # Box 3
-            draw.rectangle([400, 350, 550, 400], outline='#27ae60', width=2, fill='#d5f4e6')
-            draw.text((475-20, 370), "End", fill='#2c3e50', font=font_medium)
-            
-            # Add some code snippet info
-            lines = mermaid_code.split('\n')[:5]  # First 5 lines
-            y_pos = 450
-            draw.text((100, y_pos), "Original Mermaid Code:", fill='#7f8c8d', font=font_small)
-            for i, line in enumerate(lines):
-                if line.strip():
-                    draw.text((100, y_pos + 20 + i*15), line[:50], fill='#95a5a6', font=font_small)
-            
-            # Note
-            draw.text((100, 550), "Note: Install Mermaid CLI for actual conversion", fill='#e67e22', font=font_small)
+            # Only the code snippet changes between demo images, so the
+            # drawn and encoded PNG is reused for repeated snippets
+            snippet = tuple(_first_lines(mermaid_code, 5, 50))  # First 5 lines
             
             # Save the image
-            img.save(output_path, 'PNG')
+            Path(output_path).write_bytes(_demo_png(snippet))
             return True
             
         except Exception as e:
-            print(f"❌ Error creating demo image: {str(e)}")
-            return False
-
-    def _test_mermaid_cli_with_conversion(self, cli_path):
-        """
-        Test if the Mermaid CLI can actually perform conversions.
-        This includes checking for Chromium/browser dependencies.
-        """
-        try:
-            # Create a simple test diagram
-            test_code = "graph TD; A-->B"
-            
-            # Create temporary files
-            import tempfile
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.mmd', delete=False) as temp_input:
-                temp_input.write(test_code)
-                temp_input_path = temp_input.name
-            
-            temp_output_path = temp_input_path.replace('.mmd', '.png')
-            
-            # Try to convert
-            if "node " in cli_path:
-                cmd = f"{cli_path} -i \"{temp_input_path}\" -o \"{temp_output_path}\""
-            else:
-                cmd = f"\"{cli_path}\" -i \"{temp_input_path}\" -o \"{temp_output_path}\""
-            
-            result = subprocess.run(
-                cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=30,
-                encoding='utf-8',
-                errors='ignore'
-            )
-            
-            # Clean up
-            try:
-                os.unlink(temp_input_path)
-                if os.path.exists(temp_output_path):
-                    os.unlink(temp_output_path)
-            except:
-                pass
-            
-            # Check if conversion was successful
-            if result.returncode == 0:
-                return True
-            else:
-                print(f"  Conversion test failed: {result.stderr}")
-                return False
-                
-        except Exception as e:
-            print(f"  Conversion test error: {e}")
+            logger.error("❌ Error creating demo image: %s", e)
             return False
 
 def create_sample_mermaid():
@@ -498,9 +827,12 @@ Examples:
     parser.add_argument("-c", "--config", help="Configuration file (JSON)")
     parser.add_argument("--sample", action="store_true", help="Create a sample Mermaid file")
     parser.add_argument("--check", action="store_true", help="Check dependencies")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show conversion progress")
     
     args = parser.parse_args()
     
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+    
     converter = MermaidConverter()
     
     # Load configuration if provided
@@ -515,7 +847,7 @@ Examples:
     
     # Handle different operations
     if args.check:
-        if converter._check_dependencies():
+        if converter.verify_dependencies():
             print("✅ All dependencies are working correctly")
             return 0
         else:
@@ -540,6 +872,7 @@ Examples:
     
     elif args.directory:
         successful, total = converter.batch_convert(args.directory, args.output_directory, config)
+        print(f"✅ Conversion complete: {successful}/{total} files converted successfully")
         return 0 if successful == total else 1
     
     else:
@@ -0,0 +1,57 @@
+#!/usr/bin/env node
+/**
+ * Persistent Mermaid renderer
+ * ===========================
+ *
+ * Keeps a single headless browser open so that each diagram no longer pays
+ * for a fresh Node.js + Chromium start-up. Used by mermaid_to_png.py.
+ *
+ * Protocol: one JSON request per line on stdin,
+ *   {"code": "graph TD; A-->B", "config": {...}}
+ * answered by one JSON line on stdout,
+ *   {"png_b64": "..."}  or  {"error": "..."}
+ */
+
+import readline from 'node:readline';
+import puppeteer from 'puppeteer';
+import { renderMermaid } from '@mermaid-js/mermaid-cli';
+
+// Same limit the Python side uses for a one-off mmdc run
+const RENDER_TIMEOUT_MS = 45000;
+
+// mmdc's default output settings
+const VIEWPORT = { width: 800, height: 600, deviceScaleFactor: 1 };
+
+function withTimeout(promise, ms) {
+  let timer;
+  const timeout = new Promise((_, reject) => {
+    timer = setTimeout(() => reject(new Error(`Render timed out after ${ms} ms`)), ms);
+  });
+  return Promise.race([promise, timeout]).finally(() => clearTimeout(timer));
+}
+
+const browser = await puppeteer.launch({ headless: 'new' });
+
+const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+for await (const line of rl) {
+  if (!line.trim()) continue;
+
+  let response;
+  try {
+    const { code, config } = JSON.parse(line);
+    const { data } = await withTimeout(
+      renderMermaid(browser, code, 'png', {
+        viewport: VIEWPORT,
+        backgroundColor: 'white',
+        mermaidConfig: config || {},
+      }),
+      RENDER_TIMEOUT_MS,
+    );
+    response = { png_b64: Buffer.from(data).toString('base64') };
+  } catch (err) {
+    response = { error: String((err && err.message) || err) };
+  }
+  process.stdout.write(JSON.stringify(response) + '\n');
+}
+
+await browser.close();
@@ -12,13 +12,14 @@ Date: July 2025
 
 import os
 import json
+import logging
+import argparse
 import base64
-import tempfile
-from pathlib import Path
+import hashlib
 from flask import Flask, request, jsonify, send_file, render_template
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from mermaid_to_png import MermaidConverter
+from mermaid_to_png import MermaidConverter, is_mermaid_diagram
 import io
 
 app = Flask(__name__)
@@ -26,17 +27,29 @@ CORS(app)
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-UPLOAD_FOLDER = 'uploads'
-OUTPUT_FOLDER = 'outputs'
 
-# Create necessary directories
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
-# Initialize converter
+# Initialize converter; it also keeps the in-memory cache of rendered PNGs
 converter = MermaidConverter()
 
 
+def _png_filename(filename):
+    """Sanitise a requested filename and make sure it ends in .png."""
+    filename = secure_filename(filename)
+    return filename if filename.endswith('.png') else filename + '.png'
+
+
+def _png_response(png_data, filename, rendered):
+    """Send PNG bytes as-is, without the base64/JSON envelope."""
+    response = send_file(io.BytesIO(png_data), mimetype='image/png', download_name=filename)
+    if rendered:
+        # The same diagram and config always produce the same image
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        # Demo placeholders must be replaced once mmdc works
+        response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 @app.route('/')
 def index():
     """Serve the main web interface."""
@@ -55,7 +68,7 @@ def health_check():
 @app.route('/api/check-dependencies')
 def check_dependencies():
     """Check if all dependencies are available."""
-    is_available = converter._check_dependencies()
+    is_available = converter.verify_dependencies()
     return jsonify({
         'dependencies_ok': is_available,
         'mermaid_cli': converter.mermaid_cli
@@ -73,6 +86,8 @@ def convert_mermaid():
         "config": {...},  // optional
         "filename": "diagram.png"  // optional
     }
+    
+    Add ?raw=1 to receive the image/png bytes instead of base64 JSON.
     """
     try:
         data = request.get_json()
@@ -81,30 +96,19 @@ def convert_mermaid():
             return jsonify({'error': 'Missing mermaid_code in request'}), 400
         
         mermaid_code = data['mermaid_code']
-        config = data.get('config', None)
-        filename = secure_filename(data.get('filename', 'diagram.png'))
-        
-        if not filename.endswith('.png'):
-            filename += '.png'
-        
-        # Create output file path
-        output_path = os.path.join(OUTPUT_FOLDER, filename)
+        if not isinstance(mermaid_code, str) or not is_mermaid_diagram(mermaid_code):
+            return jsonify({'success': False, 'error': 'not a mermaid diagram'}), 400
         
         # Convert the Mermaid code
-        success = converter.convert_mermaid_text(mermaid_code, output_path, config)
+        png_data, rendered = converter.render_png(mermaid_code, data.get('config'))
         
-        if success and os.path.exists(output_path):
-            # Read the generated PNG file and encode as base64
-            with open(output_path, 'rb') as f:
-                png_data = f.read()
-                png_base64 = base64.b64encode(png_data).decode('utf-8')
-            
-            # Clean up the file
-            os.remove(output_path)
-            
+        if png_data is not None:
+            filename = _png_filename(data.get('filename', 'diagram.png'))
+            if request.args.get('raw'):
+                return _png_response(png_data, filename, rendered)
             return jsonify({
                 'success': True,
-                'image_data': png_base64,
+                'image_data': base64.b64encode(png_data).decode('utf-8'),
                 'filename': filename,
                 'message': 'Conversion successful'
             })
@@ -125,6 +129,8 @@ def convert_mermaid():
 def convert_file():
     """
     Convert uploaded Mermaid file to PNG.
+    
+    Add ?raw=1 to receive the image/png bytes instead of base64 JSON.
     """
     try:
         if 'file' not in request.files:
@@ -137,14 +143,18 @@ def convert_file():
         if not file.filename.endswith('.mmd'):
             return jsonify({'error': 'File must have .mmd extension'}), 400
         
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        input_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(input_path)
+        # Read the upload in memory rather than saving it to disk
+        try:
+            mermaid_code = file.stream.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            return jsonify({'error': 'File must be UTF-8 encoded text'}), 400
+        
+        if not is_mermaid_diagram(mermaid_code):
+            return jsonify({'success': False, 'error': 'not a mermaid diagram'}), 400
         
         # Prepare output filename
+        filename = secure_filename(file.filename)
         output_filename = filename.replace('.mmd', '.png')
-        output_path = os.path.join(OUTPUT_FOLDER, output_filename)
         
         # Get optional config
         config = None
@@ -155,29 +165,18 @@ def convert_file():
                 pass
         
         # Convert the file
-        success = converter.convert_file(input_path, output_path, config)
+        png_data, rendered = converter.render_png(mermaid_code, config)
         
-        if success and os.path.exists(output_path):
-            # Read the generated PNG file and encode as base64
-            with open(output_path, 'rb') as f:
-                png_data = f.read()
-                png_base64 = base64.b64encode(png_data).decode('utf-8')
-            
-            # Clean up files
-            os.remove(input_path)
-            os.remove(output_path)
-            
+        if png_data is not None:
+            if request.args.get('raw'):
+                return _png_response(png_data, output_filename, rendered)
             return jsonify({
                 'success': True,
-                'image_data': png_base64,
+                'image_data': base64.b64encode(png_data).decode('utf-8'),
                 'filename': output_filename,
                 'message': 'File conversion successful'
             })
         else:
-            # Clean up input file even if conversion failed
-            if os.path.exists(input_path):
-                os.remove(input_path)
-            
             return jsonify({
                 'success': False,
                 'error': 'File conversion failed'
@@ -190,13 +189,11 @@ def convert_file():
         }), 500
 
 
-@app.route('/api/examples')
-def get_examples():
-    """Get example Mermaid diagrams."""
-    examples = {
-        'flowchart': {
-            'name': '流程图',
-            'code': '''graph TD
+# Example Mermaid diagrams served by /api/examples
+EXAMPLES = {
+    'flowchart': {
+        'name': '流程图',
+        'code': '''graph TD
     A[开始] --> B{条件判断}
     B -->|是| C[执行操作]
     B -->|否| D[其他操作]
@@ -206,10 +203,10 @@ def get_examples():
     style A fill:#e1f5fe
     style E fill:#c8e6c9
     style C fill:#fff3e0'''
-        },
-        'sequence': {
-            'name': '序列图',
-            'code': '''sequenceDiagram
+    },
+    'sequence': {
+        'name': '序列图',
+        'code': '''sequenceDiagram
     participant 用户
     participant 系统
     participant 数据库
@@ -218,10 +215,10 @@ def get_examples():
     系统->>数据库: 查询数据
     数据库-->>系统: 返回结果
     系统-->>用户: 响应结果'''
-        },
-        'class': {
-            'name': '类图',
-            'code': '''classDiagram
+    },
+    'class': {
+        'name': '类图',
+        'code': '''classDiagram
     class Animal {
         +String name
         +int age
@@ -240,19 +237,19 @@ def get_examples():
     
     Animal <|-- Dog
     Animal <|-- Cat'''
-        },
-        'pie': {
-            'name': '饼图',
-            'code': '''pie title 编程语言使用统计
+    },
+    'pie': {
+        'name': '饼图',
+        'code': '''pie title 编程语言使用统计
     "Python" : 35
     "JavaScript" : 25
     "Java" : 20
     "C++" : 12
     "其他" : 8'''
-        },
-        'gitgraph': {
-            'name': 'Git图',
-            'code': '''gitgraph
+    },
+    'gitgraph': {
+        'name': 'Git图',
+        'code': '''gitgraph
     commit id: "初始提交"
     branch develop
     checkout develop
@@ -261,18 +258,48 @@ def get_examples():
     checkout main
     merge develop
     commit id: "发布v1.0"'''
-        }
     }
-    
-    return jsonify(examples)
+}
+
+# The examples never change, so serialize them once at import
+# Sorted keys keep the same order jsonify used
+_EXAMPLES_BODY = json.dumps(EXAMPLES, sort_keys=True).encode('utf-8')
+_EXAMPLES_ETAG = hashlib.md5(_EXAMPLES_BODY).hexdigest()
+
+
+@app.route('/api/examples')
+def get_examples():
+    """Get example Mermaid diagrams."""
+    # If-None-Match uses weak comparison, e.g. for W/ tags rewritten by proxies
+    if request.if_none_match.contains_weak(_EXAMPLES_ETAG):
+        return app.response_class(status=304, headers={'ETag': f'"{_EXAMPLES_ETAG}"'})
+    return app.response_class(_EXAMPLES_BODY, mimetype='application/json',
+                              headers={'ETag': f'"{_EXAMPLES_ETAG}"'})
 
 
 if __name__ == '__main__':
-    # Check dependencies on startup
-    if not converter._check_dependencies():
+    logging.basicConfig(level=logging.WARNING)
+    
+    if converter.demo_mode:
         print("⚠️ Warning: Mermaid CLI dependencies not available")
         print("Some features may not work properly")
     
+    parser = argparse.ArgumentParser(description="Mermaid to PNG Web Server")
+    parser.add_argument("--reload", action="store_true",
+                        help="Use the Flask development server with reloader and debugger")
+    args = parser.parse_args()
+    
     print("🚀 Starting Mermaid to PNG Web Server...")
     print("📱 Open http://localhost:5000 in your browser")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    
+    if args.reload or os.environ.get('FLASK_ENV') == 'development':
+        app.run(debug=True, host='0.0.0.0', port=5000)
+    else:
+        try:
+            from waitress import serve
+        except ImportError:
+            print("💡 Install waitress for a production server: pip install waitress")
+            app.run(host='0.0.0.0', port=5000, threaded=True)
+        else:
+            # A thread pool lets several conversions run at once
+            serve(app, host='0.0.0.0', port=5000, threads=8)